@@ -1,4 +1,8 @@
-from fastapi import FastAPI, Query
+import os
+import sys
+from fastapi import FastAPI, Query, Response
+import numpy as np
+import orjson
 import pandas as pd
 from functools import lru_cache
 from fastapi.middleware.cors import CORSMiddleware
@@ -29,91 +33,180 @@ app.add_middleware(
 
 
 
+EXCEL_FILE = "PSGC-2Q-2025-Publication-Datafile.xlsx"
+PARQUET_FILE = "psgc.parquet"
+PSGC_COLUMNS = ["10-digit PSGC", "Name", "Geographic Level"]
+
+
+def read_psgc_sheet():
+    """Read the PSGC sheet from its Parquet copy, converting the Excel file when the copy is stale."""
+    if not os.path.exists(PARQUET_FILE) or os.path.getmtime(PARQUET_FILE) < os.path.getmtime(EXCEL_FILE):
+        # Only the columns the API reads are parsed; headers may carry stray whitespace.
+        sheet = pd.read_excel(
+            EXCEL_FILE, sheet_name="PSGC", engine="calamine",
+            usecols=lambda column: column.strip() in PSGC_COLUMNS,
+        )
+        sheet.columns = sheet.columns.str.strip()
+        # Write beside the target and swap it in, so concurrent workers never read a partial file.
+        tmp_file = f"{PARQUET_FILE}.{os.getpid()}.tmp"
+        sheet[PSGC_COLUMNS].to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, PARQUET_FILE)
+    return pd.read_parquet(PARQUET_FILE, columns=PSGC_COLUMNS)
+
+
+def prefix_column(codes, width):
+    """Categorical of the zero-padded `width`-digit prefixes of integer PSGC codes."""
+    # Integer division drops the trailing digits; only distinct prefixes are formatted.
+    prefixes, positions = np.unique(codes // 10 ** (10 - width), return_inverse=True)
+    return pd.Categorical.from_codes(positions, [str(prefix).zfill(width) for prefix in prefixes])
+
+
 @lru_cache(maxsize=1)
 def load_data():
-    """Load PSGC data from Excel and cache in memory."""
-    df = pd.read_excel("PSGC-2Q-2025-Publication-Datafile.xlsx", sheet_name="PSGC")
-    df.columns = df.columns.str.strip()
-    code_to_name = dict(zip(df["10-digit PSGC"].astype(str), df["Name"]))
-    code_to_level = dict(zip(df["10-digit PSGC"].astype(str), df["Geographic Level"]))
-    return df, code_to_name, code_to_level
-
-df, code_to_name, code_to_level = load_data()
-
-def build_full_path(psgc_code: str) -> str:
-    """Builds hierarchical path for PSGC code.
-    Handles:
-    1. Regions without provinces
-    2. Cities with sub-municipalities
-    """
-    psgc_code = str(psgc_code)
-    level = code_to_level.get(psgc_code)
-    parts = []
-
-    # Region
-    region = next(
-        (name for code, name in code_to_name.items()
-         if code.startswith(psgc_code[:2]) and code_to_level[code] == "Reg"),
-        None
-    )
-    if region:
-        parts.append(region)
-
-    # Province (only if exists)
-    province = next(
-        (name for code, name in code_to_name.items()
-         if code.startswith(psgc_code[:4]) and code_to_level[code] == "Prov"),
-        None
-    )
-    if province:
-        parts.append(province)
-
-    # City or Municipality (parent of sub-muni or barangay)
-    city_mun = next(
-        (name for code, name in code_to_name.items()
-         if code.startswith(psgc_code[:6]) and code_to_level[code] in ["City", "Mun"]),
-        None
-    )
-    if city_mun:
-        parts.append(city_mun)
-
-    # Sub-Municipality (if exists)
-    sub_mun = next(
-        (name for code, name in code_to_name.items()
-         if code.startswith(psgc_code[:7]) and code_to_level[code] == "SubMun"),
-        None
-    )
-    if sub_mun:
-        parts.append(sub_mun)
-
-    # Barangay (last level)
-    if level == "Bgy":
-        parts.append(code_to_name.get(psgc_code))
-
-    return " > ".join(parts)
+    """Load PSGC data and cache in memory."""
+    df = read_psgc_sheet()
+    df["Geographic Level"] = df["Geographic Level"].astype("category")
+    # Codes are stored as integers, so regions 01-09 lose their leading zero.
+    df["code_str"] = df["10-digit PSGC"].astype(str).str.zfill(10)
+    # Prefixes of the PSGC hierarchy (RR PPP MM BBB) for equality filters.
+    codes = df["10-digit PSGC"].to_numpy(dtype=np.int64)
+    df["code2"] = prefix_column(codes, 2)
+    df["code5"] = prefix_column(codes, 5)
+    df["code7"] = prefix_column(codes, 7)
+    df["name_lower"] = df["Name"].astype(str).str.lower()
+    # One interned str per level, shared by every row that refers to it.
+    levels = [sys.intern(level) for level in df["Geographic Level"].cat.categories]
+    row_levels = [levels[code] if code >= 0 else None for code in df["Geographic Level"].cat.codes.tolist()]
+
+    # Parent lookups keyed by PSGC prefix.
+    reg_by_prefix2 = {}
+    prov_by_prefix5 = {}
+    citymun_by_prefix7 = {}
+    submun_by_prefix7 = {}
+    for code, name, level in zip(df["code_str"], df["Name"], row_levels):
+        if level == "Reg":
+            reg_by_prefix2.setdefault(sys.intern(code[:2]), name)
+        elif level == "Prov":
+            prov_by_prefix5.setdefault(sys.intern(code[:5]), name)
+        elif level in ("City", "Mun"):
+            citymun_by_prefix7.setdefault(sys.intern(code[:7]), name)
+        elif level == "SubMun":
+            submun_by_prefix7.setdefault(sys.intern(code[:7]), name)
+    # A sub-municipality's parent city holds the "00" municipality digits.
+    for prefix in submun_by_prefix7:
+        city = citymun_by_prefix7.get(prefix[:5] + "00")
+        if city:
+            citymun_by_prefix7[prefix] = city
+    prefix_lookups = (reg_by_prefix2, prov_by_prefix5, citymun_by_prefix7, submun_by_prefix7)
+
+    # Row positions of each level, so listings skip the level filter entirely.
+    level_codes = df["Geographic Level"].cat.codes
+    level_rows = {
+        level: np.flatnonzero(level_codes == code)
+        for code, level in enumerate(df["Geographic Level"].cat.categories)
+    }
+
+    # Level -> trigram -> row positions, so a search only checks names of the requested
+    # level that share every trigram of the query.
+    trigram_index = {}
+    for row, (name, level) in enumerate(zip(df["name_lower"].tolist(), row_levels)):
+        level_index = trigram_index.setdefault(level, {})
+        for i in range(len(name) - 2):
+            level_index.setdefault(name[i:i + 3], set()).add(row)
+    return df, prefix_lookups, level_rows, trigram_index
+
+df, prefix_lookups, level_rows, trigram_index = load_data()
+reg_by_prefix2, prov_by_prefix5, citymun_by_prefix7, submun_by_prefix7 = prefix_lookups
+
+def normalize_code(psgc_code: str) -> str:
+    """Restore the leading zero dropped from 9-digit PSGC codes."""
+    return psgc_code.zfill(10) if len(psgc_code) == 9 else psgc_code
+
+
+def lookup_names(prefixes, lookup):
+    """Map a prefix column through a lookup table, with "" where there is no match."""
+    return prefixes.map(lookup).astype(object).fillna("").tolist()
+
+
+# Paths never change after load, so resolve them once instead of per request.
+# Each level is mapped over the prefix categories, then joined in one pass.
+path_parts = zip(
+    lookup_names(df["code2"], reg_by_prefix2),
+    lookup_names(df["code5"], prov_by_prefix5),
+    lookup_names(df["code7"], citymun_by_prefix7),
+    lookup_names(df["code7"], submun_by_prefix7),
+    df["Name"].where(df["Geographic Level"] == "Bgy").astype(object).fillna("").tolist(),
+)
+df["full_path"] = [" > ".join(part for part in parts if part) for parts in path_parts]
+
+# One response record per row; endpoints pick records by row position instead of slicing df.
+records = df[["10-digit PSGC", "Name", "full_path"]].to_dict(orient="records")
+names_lower = df["name_lower"].tolist()
+
+# Unfiltered listings are identical on every request, so build their records once.
+citi_muni_rows = np.union1d(level_rows["City"], level_rows["Mun"])
+regions_records = [records[row] for row in level_rows["Reg"]]
+provinces_records = [records[row] for row in level_rows["Prov"]]
+citimuni_records = [records[row] for row in citi_muni_rows]
+barangays_records = [records[row] for row in level_rows["Bgy"]]
+submun_records = [records[row] for row in level_rows["SubMun"]]
+
+
+def group_records(level_records, rows, column):
+    """Group cached records by a prefix column, keeping dataset order."""
+    groups = {}
+    for prefix, record in zip(df[column].iloc[rows], level_records):
+        groups.setdefault(prefix, []).append(record)
+    return groups
+
+
+# Filtered listings become a dict lookup instead of a scan over the level's rows.
+prov_records_by_reg2 = group_records(provinces_records, level_rows["Prov"], "code2")
+citimuni_records_by_prov5 = group_records(citimuni_records, citi_muni_rows, "code5")
+citimuni_records_by_reg2 = group_records(citimuni_records, citi_muni_rows, "code2")
+submun_records_by_city5 = group_records(submun_records, level_rows["SubMun"], "code5")
+bgy_records_by_mun7 = group_records(barangays_records, level_rows["Bgy"], "code7")
+
+# Serialized once; unfiltered listings send these bytes as-is.
+regions_json = orjson.dumps(regions_records)
+provinces_json = orjson.dumps(provinces_records)
+citimuni_json = orjson.dumps(citimuni_records)
+barangays_json = orjson.dumps(barangays_records)
+
+
+def cached_group_json(groups):
+    """Serialize a prefix's records on first request and keep the bytes in an LRU cache."""
+    @lru_cache(maxsize=4096)
+    def group_json(prefix: str) -> bytes:
+        return orjson.dumps(groups.get(prefix, []))
+    return group_json
+
+
+# Filtered responses are cached by normalized code prefix, not by the raw query.
+prov_json_by_reg2 = cached_group_json(prov_records_by_reg2)
+citimuni_json_by_prov5 = cached_group_json(citimuni_records_by_prov5)
+citimuni_json_by_reg2 = cached_group_json(citimuni_records_by_reg2)
+submun_json_by_city5 = cached_group_json(submun_records_by_city5)
+bgy_json_by_mun7 = cached_group_json(bgy_records_by_mun7)
+
+
+def json_response(content: bytes) -> Response:
+    """Wrap serialized JSON bytes in a response."""
+    return Response(content=content, media_type="application/json")
 
 
 @app.get("/api/regions", summary="List all regions")
 def get_regions():
     """Retrieve all regions in the PSGC dataset."""
-    regions = df[df["Geographic Level"] == "Reg"][["10-digit PSGC", "Name"]].copy()
-    regions["full_path"] = regions["Name"]
-    return regions.to_dict(orient="records")
+    return json_response(regions_json)
 
 
 @app.get("/api/provinces", summary="List provinces (optional filter by region code)")
 def get_provinces(region_code: str = Query(None, description="Optional region PSGC code to filter")):
     """Retrieve provinces. Optionally filter by a region PSGC code."""
-    if region_code:
-        prov_df = df[
-            (df["Geographic Level"] == "Prov") &
-            (df["10-digit PSGC"].astype(str).str.startswith(region_code[:2]))
-        ][["10-digit PSGC", "Name"]]
-    else:
-        prov_df = df[df["Geographic Level"] == "Prov"][["10-digit PSGC", "Name"]]
-
-    prov_df["full_path"] = prov_df["10-digit PSGC"].astype(str).apply(build_full_path)
-    return prov_df.to_dict(orient="records")
+    if not region_code:
+        return json_response(provinces_json)
+    return json_response(prov_json_by_reg2(normalize_code(region_code)[:2]))
 
 
 @app.get("/api/citi_muni", summary="List cities and municipalities (optional filter by province or region code)")
@@ -125,46 +218,45 @@ def get_cities_municipalities(
     If province_code is given, filter by province.
     If region_code is given, filter by region.
     """
+    if not province_code and not region_code:
+        return json_response(citimuni_json)
     if province_code:
-        citi_muni_df = df[
-            df["Geographic Level"].isin(["City", "Mun"]) &
-            (df["10-digit PSGC"].astype(str).str.startswith(province_code[:4]))
-        ][["10-digit PSGC", "Name"]]
-    elif region_code:
-        citi_muni_df = df[
-            df["Geographic Level"].isin(["City", "Mun"]) &
-            (df["10-digit PSGC"].astype(str).str.startswith(region_code[:2]))
-        ][["10-digit PSGC", "Name"]]
-    else:
-        citi_muni_df = df[df["Geographic Level"].isin(["City", "Mun"])][["10-digit PSGC", "Name"]]
-
-    citi_muni_df["full_path"] = citi_muni_df["10-digit PSGC"].astype(str).apply(build_full_path)
-    return citi_muni_df.to_dict(orient="records")
+        return json_response(citimuni_json_by_prov5(normalize_code(province_code)[:5]))
+    return json_response(citimuni_json_by_reg2(normalize_code(region_code)[:2]))
 
 @app.get("/api/sub_muni", summary="List sub-municipalities (optional filter by city code)")
 def get_sub_municipalities(city_code: str = Query(..., description="City PSGC code to filter")):
     """Retrieve sub-municipalities for a given city."""
-    submun_df = df[
-        (df["Geographic Level"] == "SubMun") &
-        (df["10-digit PSGC"].astype(str).str.startswith(city_code[:4]))
-    ][["10-digit PSGC", "Name"]]
-
-    submun_df["full_path"] = submun_df["10-digit PSGC"].astype(str).apply(build_full_path)
-    return submun_df.to_dict(orient="records")
+    return json_response(submun_json_by_city5(normalize_code(city_code)[:5]))
 
 @app.get("/api/barangays", summary="List barangays (optional filter by municipality code)")
 def get_barangays(municipality_code: str = Query(None, description="Optional municipality PSGC code to filter")):
     """Retrieve barangays. Optionally filter by a municipality PSGC code."""
-    if municipality_code:
-        bgy_df = df[
-            (df["Geographic Level"] == "Bgy") &
-            (df["10-digit PSGC"].astype(str).str.startswith(municipality_code[:7]))
-        ][["10-digit PSGC", "Name"]]
+    if not municipality_code:
+        return json_response(barangays_json)
+    return json_response(bgy_json_by_mun7(normalize_code(municipality_code)[:7]))
+
+
+def search_records(level: str, q_lower: str) -> list:
+    """Records of a level whose lowercase name contains q_lower."""
+    if len(q_lower) >= 3:
+        level_index = trigram_index.get(level, {})
+        postings = [level_index.get(q_lower[i:i + 3], set()) for i in range(len(q_lower) - 2)]
+        rows = [
+            row for row in sorted(set.intersection(*sorted(postings, key=len)))
+            if q_lower in names_lower[row]
+        ]
     else:
-        bgy_df = df[df["Geographic Level"] == "Bgy"][["10-digit PSGC", "Name"]]
+        # Too short for a trigram, check every name of the level.
+        level_positions = level_rows[level].tolist() if level in level_rows else []
+        rows = [row for row in level_positions if q_lower in names_lower[row]]
+    return [records[row] for row in rows]
 
-    bgy_df["full_path"] = bgy_df["10-digit PSGC"].astype(str).apply(build_full_path)
-    return bgy_df.to_dict(orient="records")
+
+@lru_cache(maxsize=4096)
+def search_json(level: str, q_lower: str) -> bytes:
+    """Serialize search results for queries of three or more characters."""
+    return orjson.dumps(search_records(level, q_lower))
 
 
 @app.get("/api/search", summary="Search for locations by name and level")
@@ -174,10 +266,7 @@ def search_locations(
 ):
     """Search for a location in the PSGC dataset by name and geographic level."""
     q_lower = q.lower()
-    results = df[
-        (df["Geographic Level"] == level) &
-        (df["Name"].str.lower().str.contains(q_lower, na=False))
-    ][["10-digit PSGC", "Name"]]
-
-    results["full_path"] = results["10-digit PSGC"].astype(str).apply(build_full_path)
-    return results.to_dict(orient="records")
+    if len(q_lower) < 3:
+        # Short queries match megabytes of barangays; serialize them each time instead of caching.
+        return json_response(orjson.dumps(search_records(level, q_lower)))
+    return json_response(search_json(level, q_lower))